@@ -1,5 +1,11 @@
+import pytest
+from click.testing import CliRunner
 import typed_dict_generator
 import json
+import collections
+import io
+import copy
+import pickle
 
 
 def gen_code() -> str:
@@ -24,3 +30,185 @@ def test_generated_code():
     from typing import Union, List
 
     exec(gen_code())
+
+
+def test_find_unused_name():
+    taken_names = {"Foo", "Foo2", "Foo4"}
+    next_suffix: dict = {}
+    for expected in ["Foo3", "Foo5", "Foo6"]:
+        name = typed_dict_generator.find_unused_name("Foo", taken_names, next_suffix)
+        assert name == expected
+        taken_names.add(name)
+
+
+def test_no_typing_prefix():
+    data = {"a": [[1, "x"], {"b": None}], "c": {"d": [True, 2.0]}, "e": []}
+    code = typed_dict_generator.generate_typed_dict_code("Response", data)
+    assert "typing." not in code
+
+
+def test_generate_from_stream():
+    pytest.importorskip("ijson")
+    with open("test_files/response.json", "rb") as f:
+        streamed = typed_dict_generator.generate_typed_dict_code_from_stream(
+            "Response", f
+        )
+    assert streamed == gen_code()
+
+
+def test_generate_from_stream_big_numbers():
+    pytest.importorskip("ijson")
+    document = b'{"a": 123456789012345678901234567890, "b": 1.5, "c": 1e400}'
+    streamed = typed_dict_generator.generate_typed_dict_code_from_stream(
+        "Response", io.BytesIO(document)
+    )
+    assert (
+        streamed
+        == 'Response = TypedDict("Response", { "a": int, "b": float, "c": float })\n'
+    )
+
+
+def test_compile_renderer():
+    with open("test_files/response.json") as f:
+        data = json.load(f)
+    types = typed_dict_generator.get_types("Response", data)
+    assignments = {ty: None for ty in types}
+    dict_code = next(
+        ty for ty in types if isinstance(ty, typed_dict_generator.TypedDictCode)
+    )
+    assignments[dict_code] = "Dict2"
+
+    render = typed_dict_generator.compile_renderer(types[-1])
+    assert render(assignments) == types[-1].to_str(assignments)
+
+
+def test_find_all_typed_dicts():
+    data = {"a": {"b": [{"c": 1}, 2]}, "d": {"e": None}}
+    paths = [
+        path for path, _ in typed_dict_generator.find_all_typed_dicts("Response", data)
+    ]
+    assert paths == ["Response", "Response.a", "Response.a.b", "Response.d"]
+
+
+def test_accumulate_typed_dicts():
+    data = {"a": [{"b": 1}, {"c": "x"}]}
+    accumulated = typed_dict_generator.accumulate_typed_dicts("Response", data)
+    assert list(accumulated) == ["Response", "Response.a"]
+    assert [code.dict_[0][0] for code in accumulated["Response.a"]] == ["b", "c"]
+
+
+def test_accumulate_typed_dicts_drops_duplicates():
+    data = {"a": [[{"b": 1}], {"b": 1}]}
+    accumulated = typed_dict_generator.accumulate_typed_dicts("Response", data)
+    assert len(accumulated["Response.a"]) == 1
+
+
+def test_union_order_independent_of_input_order():
+    data = {"a": [{"b": 1}, {"c": "x"}, [1], ["x"]]}
+    reversed_data = {"a": data["a"][::-1]}
+    types = typed_dict_generator.get_types("Response", data)
+    reversed_types = typed_dict_generator.get_types("Response", reversed_data)
+    assert types[-1] == reversed_types[-1]
+
+
+def test_union_order_deep_types():
+    # the types only differ at the bottom, far beyond the recursion limit
+    def deep(leaf):
+        data = {"x": leaf}
+        for _ in range(2000):
+            data = {"a": data}
+        return data
+
+    def leaf_types(data):
+        union = typed_dict_generator.get_types("Response", data)[-1].dict_[0][1]
+        leaves = []
+        for code in union.inner_type.inner_types:
+            while code.dict_[0][0] == "a":
+                code = code.dict_[0][1]
+            leaves.append(code.dict_[0][1])
+        return leaves
+
+    leaves = leaf_types({"a": [deep(1), deep("x")]})
+    assert leaves == leaf_types({"a": [deep("x"), deep(1)]})
+
+
+def test_dict_and_list_subclasses():
+    data = json.loads('{"a": [{"b": 1}]}', object_pairs_hook=collections.OrderedDict)
+    code = typed_dict_generator.generate_typed_dict_code("Response", data)
+    assert code == typed_dict_generator.generate_typed_dict_code(
+        "Response", {"a": [{"b": 1}]}
+    )
+
+
+def test_compile_renderer_deep():
+    data: dict = {"a": [1]}
+    for _ in range(200):
+        data = {"a": data}
+    code = typed_dict_generator.get_types("Response", data)[-1]
+    render = typed_dict_generator.compile_renderer(code)
+    assert render({}) == code.to_str({})
+    # like to_str, only None counts as unassigned
+    assert render({code: ""}) == ""
+
+
+def test_to_str_follows_assignments():
+    types = typed_dict_generator.get_types("Response", {"a": [{"b": 1}]})
+    assignments: dict = {}
+    types[-1].to_str(assignments)
+    assignments[types[0]] = "B"
+    assert types[-1].to_str(assignments) == 'TypedDict("Response", { "a": List[B] })'
+
+
+def test_copy_and_pickle():
+    types = typed_dict_generator.get_types("Response", {"a": [{"b": 1}, "x"]})
+    for code in types:
+        assert copy.copy(code) == code
+        assert copy.deepcopy(code) == code
+        assert pickle.loads(pickle.dumps(code)) == code
+
+
+@pytest.fixture(params=[False, True], ids=["load", "stream"])
+def run_cli(request, monkeypatch, tmp_path):
+    if request.param:
+        pytest.importorskip("ijson")
+    monkeypatch.setattr(typed_dict_generator, "CAN_STREAM", request.param)
+
+    def run(filename: str, content: str) -> str:
+        path = tmp_path / filename
+        path.write_text(content)
+        return CliRunner().invoke(typed_dict_generator.cli, [str(path)]).output
+
+    return run
+
+
+def test_cli(run_cli):
+    with open("test_files/response.json") as f:
+        assert run_cli("response.json", f.read()) == gen_code()
+
+
+def test_cli_big_integer(run_cli):
+    output = run_cli("big.json", '{"a": 123456789012345678901234567890, "b": 1.5}')
+    assert output == 'Big = TypedDict("Big", { "a": int, "b": float })\n'
+
+
+def test_cli_special_floats(run_cli):
+    expected = 'Nan = TypedDict("Nan", { "a": float, "b": float })\n'
+    assert run_cli("nan.json", '{"a": NaN, "b": 1e400}') == expected
+
+
+def test_cli_not_a_dict(run_cli):
+    assert run_cli("list.json", "[1, 2]") == "Json does not represent a dictionary\n"
+
+
+def test_cli_trailing_data(run_cli):
+    output = run_cli("trailing.json", '{"a": 1} {"b": 2}')
+    assert output.startswith("Input must be a valid json file.")
+
+
+def test_memo_shared_objects():
+    x = {"b": [1, {"c": None}]}
+    data = {"a": [x, x, [x]]}
+    memo: dict = {}
+    types = typed_dict_generator.get_types("Response", data, _memo=memo)
+    assert memo
+    assert types[-1] == typed_dict_generator.get_types("Response", data)[-1]
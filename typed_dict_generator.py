@@ -1,18 +1,22 @@
 from __future__ import annotations
 from typing import (
     Any,
+    Callable,
+    IO,
+    Iterable,
     Dict,
-    List,
     Optional,
     Iterator,
-    Set,
     Tuple,
     NewType,
     Protocol,
 )
+from decimal import Decimal
 import re
+import sys
 import itertools
-from dataclasses import dataclass
+import functools
+import hashlib
 
 # The KeyPath is the sequence of key accesses required to get to a certain
 # value, represented by `key1.key2.key3` etc.
@@ -26,6 +30,12 @@ JsonValue = Optional["list[Any] | dict[str, Any] | str | int | float | bool"]
 
 
 class Code(Protocol):
+    __slots__ = ()
+
+    # The rendering of types that contain no TypedDict, which doesn't depend on
+    # the assignments. None for all other types.
+    _str: Optional[str]
+
     def to_str(self, assignments: TypeAssignments) -> str:
         pass
 
@@ -33,139 +43,526 @@ class Code(Protocol):
 PATTERN = re.compile("(^|_)([a-zA-Z])")
 
 
+# The same keys tend to appear many times, e.g. in lists of records.
+@functools.lru_cache(maxsize=1024)
 def camel_case(name: str) -> str:
     return PATTERN.sub(lambda m: m.group(2).upper(), name)
 
 
-@dataclass(eq=True, frozen=True)
-class TypedDictCode(Code):
+class _HashedCode:
+    """
+    Base for the immutable code nodes. Their fields are the `__slots__` a subclass
+    declares, in constructor order. There can be one node for every value in the
+    json, so they don't get a __dict__.
+
+    Nodes compare and hash by type and fields, but the hash is computed only once.
+    Types are hashed over and over while deduplicating them and hashing the
+    fields every time would walk the entire subtree.
+    """
+
+    __slots__ = ("_hash", "_str")
+
+    _hash: int
+    _str: Optional[str]
+
+    def _set_fields(self, *fields: Any) -> None:
+        # Nodes are frozen, so the attributes must be set through object
+        for name, value in zip(self.__slots__, fields):
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, "_hash", hash((type(self), fields)))
+        object.__setattr__(self, "_str", None)
+
+    @property
+    def _fields(self) -> tuple[Any, ...]:
+        return tuple([getattr(self, name) for name in self.__slots__])
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if type(other) is not type(self):
+            return NotImplemented
+        assert isinstance(other, _HashedCode)
+        return self._hash == other._hash and self._fields == other._fields
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"cannot delete field '{name}'")
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # The fields can't be assigned after construction,
+        # so copies and pickles are constructed from the fields instead.
+        return (type(self), self._fields)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            f"{name}={value!r}" for name, value in zip(self.__slots__, self._fields)
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class TypedDictCode(_HashedCode, Code):
     """When printed, returns the Python code to generate a TypedDict."""
 
+    __slots__ = ("name", "dict_")
+
     name: str
     # Represent the dictionary as tuples so that it can be hashed.
-    # It would be nice if the constructor could convert the dictionary
-    # but I haven't figured out how to do that with dataclass(frozen=True)
-    dict_: Tuple[Tuple[str, Code], ...]
+    dict_: tuple[tuple[str, Code], ...]
+
+    def __init__(self, name: str, dict_: tuple[tuple[str, Code], ...]) -> None:
+        self._set_fields(name, dict_)
 
     def to_str(self, assignments: TypeAssignments) -> str:
         assignment = assignments.get(self)
         if assignment is not None:
             return assignment
 
-        pairs = (f'"{key}": {value.to_str(assignments)}' for key, value in self.dict_)
+        # str.join turns anything but a list into one first,
+        # so build the list directly instead of going through a generator
+        pairs = [f'"{key}": {value.to_str(assignments)}' for key, value in self.dict_]
         dict_str = "{ " + ", ".join(pairs) + " }"
 
-        dict_str = dict_str.replace("typing.", "")
-
         return f'TypedDict("{self.name}", {dict_str})'
 
 
 NoneType = type(None)
 
+_BUILTIN_NAMES = {
+    int: "int",
+    float: "float",
+    str: "str",
+    bool: "bool",
+    NoneType: "None",
+}
+
+
+# The shared BuiltInCode instance of each built-in type
+_BUILTIN_CODE: dict[type, BuiltInCode] = {}
+
+
+class BuiltInCode(_HashedCode, Code):
+    """
+    There are only five possible built-in types in json data. Constructing one
+    returns the single shared instance for its type, so they are never allocated
+    per leaf value and can compare and hash by identity, without calling into
+    Python code.
+    """
+
+    __slots__ = ("type_",)
+
+    type_: type
+    _str: str
+
+    def __new__(cls, type_: type) -> BuiltInCode:
+        instance = _BUILTIN_CODE.get(type_)
+        if instance is None:
+            instance = super().__new__(cls)
+            # not through _set_fields, the hash it computes would never be used
+            object.__setattr__(instance, "type_", type_)
+            object.__setattr__(instance, "_str", _BUILTIN_NAMES[type_])
+            _BUILTIN_CODE[type_] = instance
+        return instance
 
-@dataclass(eq=True, frozen=True)
-class BuiltInCode(Code):
-    type_: int | float | str | bool | NoneType
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
 
     def to_str(self, assignments: TypeAssignments) -> str:
-        # types of built-ins convert to str like this: <class 'classname'>
-        # this substitution extracts 'classname' from that
-        class_ = re.sub(
-            r"<class '(\w+)'>", lambda match: match.group(1), str(self.type_)
-        )
-        return class_ if class_ != "NoneType" else "None"
+        return self._str
+
+
+# construct the shared instances
+list(map(BuiltInCode, _BUILTIN_NAMES))
+
 
+def _format_union(type_strs: list[str]) -> str:
+    if not type_strs:
+        return "Any"
+    elif len(type_strs) == 1:
+        return type_strs[0]
+    elif len(type_strs) == 2:
+        # by far the most common case, format it directly
+        return f"Union[{type_strs[0]}, {type_strs[1]}]"
+    return "Union[" + ", ".join(type_strs) + "]"
+
+
+class ListCode(_HashedCode, Code):
+    __slots__ = ("inner_type",)
 
-@dataclass(eq=True, frozen=True)
-class ListCode(Code):
     inner_type: Code
 
+    def __init__(self, inner_type: Code) -> None:
+        self._set_fields(inner_type)
+        if inner_type._str is not None:
+            object.__setattr__(self, "_str", f"List[{inner_type._str}]")
+
     def to_str(self, assignments: TypeAssignments) -> str:
+        if self._str is not None:
+            return self._str
         return f"List[{self.inner_type.to_str(assignments)}]"
 
 
-@dataclass(eq=True, frozen=True)
-class UnionCode(Code):
-    inner_types: Tuple[Code, ...]
+class UnionCode(_HashedCode, Code):
+    __slots__ = ("inner_types",)
+
+    inner_types: tuple[Code, ...]
+
+    def __init__(self, inner_types: tuple[Code, ...]) -> None:
+        self._set_fields(inner_types)
+        type_strs = [t._str for t in inner_types if t._str is not None]
+        if len(type_strs) == len(inner_types):
+            object.__setattr__(self, "_str", _format_union(type_strs))
 
     def to_str(self, assignments: TypeAssignments) -> str:
-        n_types = len(self.inner_types)
-        if n_types == 0:
-            return "Any"
-        elif n_types == 1:
-            return self.inner_types[0].to_str(assignments)
-        else:
-            type_list = ", ".join(t.to_str(assignments) for t in self.inner_types)
-            return f"Union[{type_list}]"
+        if self._str is not None:
+            return self._str
+        return _format_union([t.to_str(assignments) for t in self.inner_types])
+
+
+_BUILTIN_ORDER: dict[type, int] = {int: 0, float: 1, str: 2, bool: 3, NoneType: 4}
+_CLASS_ORDER: dict[type, int] = {UnionCode: 100, ListCode: 200, TypedDictCode: 300}
 
 
 def type_order_key(type_) -> int:
-    if isinstance(type_, BuiltInCode):
-        order = [int, float, str, bool, NoneType]
-        return order.index(type_.type_)
-    elif isinstance(type_, UnionCode):
-        return 100
-    elif isinstance(type_, ListCode):
-        return 200
-    elif isinstance(type_, TypedDictCode):
-        return 300
-    else:
+    class_ = type(type_)
+    if class_ is BuiltInCode:
+        return _BUILTIN_ORDER[type_.type_]
+    order = _CLASS_ORDER.get(class_)
+    if order is None:
         raise Exception(f"Unsupported type: {type_}")
+    return order
+
+
+# Keys that order types of the same kind, by type. They are built when a type is
+# interned, from the keys of its children, see `_order_key`.
+OrderKeys = Dict[Code, Tuple[Any, ...]]
 
 
-def get_types(key: str, value: JsonValue) -> List[Code]:
+def _digest(*parts: Any) -> bytes:
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).digest()
+
+
+_BUILTIN_ORDER_KEYS: dict[Code, tuple[Any, ...]] = {
+    code: (_BUILTIN_ORDER[type_], _digest(code._str))
+    for type_, code in _BUILTIN_CODE.items()
+}
+
+
+def _order_key(code: Code, order_keys: OrderKeys) -> tuple[Any, ...]:
+    """
+    Build the key that orders `code` among the types of the same kind. It starts
+    with the name and keys of a TypedDict and the kinds of the children. It ends
+    with a digest of the entire type, which is built from the digests of the
+    children, so that types that only differ further down are told apart too
+    without the key growing with the depth of the type.
+    """
+    head: tuple[str, ...] = ()
+    children: tuple[Code, ...]
+    if type(code) is TypedDictCode:
+        head = (code.name, *[key for key, _ in code.dict_])
+        children = tuple([value for _, value in code.dict_])
+    elif type(code) is ListCode:
+        children = (code.inner_type,)
+    elif type(code) is UnionCode:
+        children = code.inner_types
+    else:
+        raise Exception(f"Unsupported type: {code}")
+    child_keys = [order_keys[child] for child in children]
+    rank = type_order_key(code)
+    child_ranks = tuple([key[0] for key in child_keys])
+    digest = _digest(rank, head, [key[-1] for key in child_keys])
+    return (rank, head, child_ranks, digest)
+
+
+def order_types(types: list[Code], order_keys: OrderKeys) -> tuple[Code, ...]:
+    """
+    Deduplicate the types and order them by `type_order_key`.
+    Types with the same key are ordered by their `order_keys`, so that the order
+    doesn't depend on the order in which the types were seen and the same set
+    of types always makes the same union.
+    """
+    # There are only a handful of distinct keys, so bucket the types by key
+    # instead of sorting all of them.
+    buckets: dict[int, list[Code]] = {}
+    for type_ in dict.fromkeys(types):
+        buckets.setdefault(type_order_key(type_), []).append(type_)
+    ordered: list[Code] = []
+    for key in sorted(buckets):
+        bucket = buckets[key]
+        # only lists and TypedDicts can share a key
+        if len(bucket) > 1:
+            bucket.sort(key=order_keys.__getitem__)
+        ordered += bucket
+    return tuple(ordered)
+
+
+# Code nodes by their class and fields
+InternTable = Dict[Tuple[type, Tuple[Any, ...]], Code]
+
+
+def _intern(
+    interned: InternTable, order_keys: OrderKeys, class_: type, *fields: Any
+) -> Any:
+    """
+    Return the node of the given class with the given fields, constructing it only
+    if it hasn't been seen before. Equal types are then always the same object,
+    so comparing them is an identity check.
+    New nodes get their order key, the nodes they consist of already have theirs.
+    """
+    key = (class_, fields)
+    code = interned.get(key)
+    if code is None:
+        code = interned[key] = class_(*fields)
+        order_keys[code] = _order_key(code, order_keys)
+    return code
+
+
+def _list_code(
+    interned: InternTable, order_keys: OrderKeys, element_types: list[Code]
+) -> ListCode:
+    # if there is only 1 type, use it directly instead of wrapping it
+    # in a Union that would just collapse into that one type
+    ordered_types = order_types(element_types, order_keys)
+    inner_type: Code
+    if len(ordered_types) == 1:
+        inner_type = ordered_types[0]
+    else:
+        inner_type = _intern(interned, order_keys, UnionCode, ordered_types)
+    return _intern(interned, order_keys, ListCode, inner_type)
+
+
+def get_types(
+    key: str, value: JsonValue, _memo: Optional[dict[tuple[int, str], Code]] = None
+) -> list[Code]:
     """
     Generate a list of types, sorted such that earlier types do not have dependencies
     on later types. The last element will be the type of the input
+
+    If `value` contains the same list or dict objects several times, e.g. because
+    it was built in Python, pass an empty dict as `_memo` to only infer their
+    types once. Parsed json never shares objects, so it would only cost memory.
     """
-    types: List[Code] = []
-    _get_type(key, value, types)
+    types: list[Code] = []
+    _get_type(key, value, types, _memo)
     return types
 
 
 def _get_type(
     key: str,
     value: JsonValue,
-    type_assignments: List[Code],
+    type_assignments: list[Code],
+    memo: Optional[dict[tuple[int, str], Code]] = None,
 ) -> Code:
+    # Post-order traversal with an explicit stack instead of recursion, so deeply
+    # nested json can't run into the recursion limit.
+    # Every frame holds the key and container being typed, an iterator over the
+    # (key, value) pairs of its children and the types of the children seen so far.
+    # The innermost frame is kept in local variables, so that it doesn't need to be
+    # unpacked from the stack again for every child. `children` is None when
+    # there is no open container.
+    stack: list[tuple[str, JsonValue, Iterator[tuple[str, JsonValue]], list[Code]]]
+    stack = []
+    parent_key: str = key
+    parent: JsonValue = None
+    children: Optional[Iterator[tuple[str, JsonValue]]] = None
+    child_types: list[Code] = []
+    # The keys stored in the types are interned with sys.intern as well. The same
+    # keys repeat across many records, so they share one string each and compare
+    # by identity when the types are interned or deduplicated.
+    interned: InternTable = {}
+    order_keys: OrderKeys = dict(_BUILTIN_ORDER_KEYS)
+    # The optional memo holds the types of the lists and dicts seen so far, by
+    # their id and key. The key is part of it because it becomes the name of
+    # TypedDicts. The objects are all kept alive by the input, so their ids stay
+    # unique.
+    code: Optional[Code]
+    while True:
+        # Parsed json only contains these exact types, so a single lookup of the
+        # type replaces a chain of isinstance checks. Subclasses of list and dict,
+        # e.g. from an object_pairs_hook, still fall back to isinstance.
+        code = _BUILTIN_CODE.get(type(value))
+        if code is None and memo is not None:
+            code = memo.get((id(value), key))
+        if code is not None:
+            type_assignments.append(code)
+        elif type(value) is list or isinstance(value, list):
+            # Long lists of scalars are common. Collecting their distinct types
+            # in a loop that runs entirely in C is much faster than visiting
+            # every element.
+            element_types = set(map(type, value))
+            scalar_types: list[Code] = [
+                _BUILTIN_CODE[t] for t in element_types if t in _BUILTIN_CODE
+            ]
+            if len(scalar_types) == len(element_types):
+                code = _list_code(interned, order_keys, scalar_types)
+                if memo is not None:
+                    memo[id(value), key] = code
+                type_assignments.append(code)
+            else:
+                # The scalars are already typed, only visit the other elements.
+                others = (e for e in value if type(e) not in _BUILTIN_CODE)
+                elements = zip(itertools.repeat(key), others)
+                if children is not None:
+                    stack.append((parent_key, parent, children, child_types))
+                parent_key, parent, children = key, value, elements
+                child_types = scalar_types
+        elif isinstance(value, dict):
+            assert key is not None
+            # The innermost dicts, which are most of them, only contain scalars.
+            # Those can be typed in loops that run entirely in C as well.
+            value_types = list(map(_BUILTIN_CODE.get, map(type, value.values())))
+            if None not in value_types:
+                items = tuple(zip(map(sys.intern, value), value_types))
+                code = _intern(interned, order_keys, TypedDictCode, key, items)
+                if memo is not None:
+                    memo[id(value), key] = code
+                type_assignments.append(code)
+            else:
+                if children is not None:
+                    stack.append((parent_key, parent, children, child_types))
+                parent_key, parent, children = key, value, iter(value.items())
+                child_types = []
+        else:
+            raise ValueError("type not supported")
+
+        # Hand the finished type to its parent and complete every container
+        # whose children have all been typed.
+        while children is not None:
+            # The elements of a list mostly have the same type. Types are interned,
+            # so repeats of the previous element's type can be skipped with an
+            # identity check instead of being hashed when deduplicating later.
+            if code is not None and (
+                not isinstance(parent, list)
+                or not child_types
+                or child_types[-1] is not code
+            ):
+                child_types.append(code)
+            child = next(children, None)
+            if child is not None:
+                key, value = child
+                break
+
+            if isinstance(parent, list):
+                code = _list_code(interned, order_keys, child_types)
+            else:
+                assert isinstance(parent, dict)
+                dict_ = tuple(zip(map(sys.intern, parent), child_types))
+                code = _intern(interned, order_keys, TypedDictCode, parent_key, dict_)
+            if memo is not None:
+                memo[id(parent), parent_key] = code
+
+            # insert new code
+            type_assignments.append(code)
+
+            if stack:
+                parent_key, parent, children, child_types = stack.pop()
+            else:
+                children = None
+        else:
+            assert code is not None
+            return code
+
+
+def get_types_from_stream(key: str, file: IO[bytes]) -> list[Code]:
+    """
+    Like `get_types`, but parses the json incrementally from `file` instead of
+    requiring the whole document in memory. Every type is only listed once.
+    Requires the optional `ijson` package.
+    """
+    import ijson  # type: ignore
+
+    # Numbers are left as ints and Decimals. With use_float=True, the C backend
+    # rejects integers that don't fit into 64 bits.
+    return _get_types_from_events(key, ijson.basic_parse(file))
+
+
+def _get_types_from_events(key: str, events: Iterable[tuple[str, Any]]) -> list[Code]:
+    # Ordered set of the finished types, so that the memory use only depends
+    # on the number of distinct types and not the size of the document.
+    types: dict[Code, None] = {}
+    interned: InternTable = {}
+    order_keys: OrderKeys = dict(_BUILTIN_ORDER_KEYS)
+    # Every frame holds the key of the container being typed, the keys of its
+    # entries if it's a dict or None if it's a list, and the types of its children.
+    # Those are a list for dicts, in the order of the keys, and an ordered set
+    # for lists, so that long lists only keep their distinct element types.
+    stack: list[tuple[str, Optional[list[str]], Any]] = []
     code: Code
-    if isinstance(value, (type(None), str, int, float, bool)):
-        code = BuiltInCode(type(value))  # type: ignore
-    elif isinstance(value, list):
-        all_types = {_get_type(key, element, type_assignments) for element in value}
-        ordered_types = sorted(all_types, key=type_order_key)
-
-        # if there is only 1 type, the Union will collapse
-        # into that one type
-        code = ListCode(UnionCode(tuple(ordered_types)))
-    elif isinstance(value, dict):
-        assert key is not None
-        types_of_keys = {
-            key: _get_type(key, val, type_assignments) for key, val in value.items()
-        }
-        code = TypedDictCode(key, tuple(types_of_keys.items()))
-    else:
-        raise ValueError("type not supported")
+    for event, value in events:
+        if event == "map_key":
+            keys = stack[-1][1]
+            assert keys is not None
+            keys.append(sys.intern(value))
+            continue
+        if event in ("start_map", "start_array"):
+            if stack:
+                parent_key, parent_keys, _ = stack[-1]
+                # list elements inherit the key of the list
+                key = parent_key if parent_keys is None else parent_keys[-1]
+            if event == "start_map":
+                stack.append((key, [], []))
+            else:
+                stack.append((key, None, {}))
+            continue
 
-    # insert new code
-    type_assignments.append(code)
-    return code
+        if event == "end_map":
+            map_key, keys, child_types = stack.pop()
+            assert keys is not None
+            # duplicate keys are resolved like json.load does, the last one wins
+            dict_ = tuple(dict(zip(keys, child_types)).items())
+            code = _intern(interned, order_keys, TypedDictCode, map_key, dict_)
+            types[code] = None
+        elif event == "end_array":
+            _, _, child_types = stack.pop()
+            code = _list_code(interned, order_keys, list(child_types))
+            types[code] = None
+        elif type(value) is Decimal:
+            code = _BUILTIN_CODE[float]
+        else:
+            code = _BUILTIN_CODE[type(value)]
+
+        if not stack:
+            # keep consuming the events, so the parser rejects trailing data
+            types[code] = None
+            continue
+        _, parent_keys, child_types = stack[-1]
+        if parent_keys is None:
+            child_types[code] = None
+        else:
+            child_types.append(code)
 
+    return list(types)
 
-def find_unused_name(name: str, taken_names: Set[str]) -> str:
-    # Inefficient as hell, but it's a rare case in most circumstances.
-    candidates = itertools.chain([name], (f"{name}{i}" for i in range(2, 10001)))
-    unused_name = next((c for c in candidates if c not in taken_names), None)
-    if unused_name is None:
-        raise Exception(
-            "Failed to find unused name. Too many assignments of types with same desired name."
-        )
-    return unused_name
+
+def find_unused_name(
+    name: str, taken_names: set[str], next_suffix: dict[str, int]
+) -> str:
+    if name not in taken_names:
+        return name
+    # Continue counting from the last suffix handed out for this name, so that
+    # many types with the same desired name don't rescan all previous candidates.
+    i = next_suffix.get(name, 2)
+    while f"{name}{i}" in taken_names:
+        i += 1
+    next_suffix[name] = i + 1
+    return f"{name}{i}"
 
 
 def generate_typed_dict_code(name: str, dictionary: dict[str, Any]) -> str:
-    types = get_types(name, dictionary)
-    type_assignments: TypeAssignments = {ty: None for ty in types}
+    return generate_code_for_types(get_types(name, dictionary))
+
+
+def generate_typed_dict_code_from_stream(name: str, file: IO[bytes]) -> str:
+    return generate_code_for_types(get_types_from_stream(name, file))
+
+
+def generate_code_for_types(types: list[Code]) -> str:
+    # Only TypedDicts get assigned to names, every other type is absent.
+    type_assignments: TypeAssignments = {}
 
     # typed dicts can't be nested, so we generate assignments for them
     # and then refer to TypedDicts nested inside other types by their variable name.
@@ -173,7 +570,7 @@ def generate_typed_dict_code(name: str, dictionary: dict[str, Any]) -> str:
     # Avoid naming conflicts both with built-in types. keywords, types from typing module
     # and other generated types
     # TODO: Add more pre-existing names
-    taken_names: Set[str] = {
+    taken_names: set[str] = {
         "int",
         "str",
         "float",
@@ -198,61 +595,192 @@ def generate_typed_dict_code(name: str, dictionary: dict[str, Any]) -> str:
         "True",
         "False",
     }
+    next_suffix: dict[str, int] = {}
 
-    output = ""
+    lines: list[str] = []
     for ty in types:
         # Eliminate duplicate types.
         # These come up a lot in real data.
-        if type_assignments[ty] is not None:
+        if type_assignments.get(ty) is not None:
             continue
-        if isinstance(ty, TypedDictCode):
-            name = find_unused_name(camel_case(ty.name), taken_names)
+        if type(ty) is TypedDictCode:
+            name = find_unused_name(camel_case(ty.name), taken_names, next_suffix)
             taken_names.add(name)
             renamed_type = TypedDictCode(name, ty.dict_)
-            output += f"{name} = {renamed_type.to_str(type_assignments)}\n"
+            lines.append(f"{name} = {renamed_type.to_str(type_assignments)}\n")
 
             type_assignments[ty] = name
 
-    return output
+    return "".join(lines)
+
+
+@functools.lru_cache(maxsize=128)
+def compile_renderer(code: Code) -> Callable[[TypeAssignments], str]:
+    """
+    Compile a function that renders `code` like `code.to_str(assignments)` does.
+    The function's source is generated for the exact shape of `code`, so it only
+    has to look up the assignments and concatenate strings. This pays off when
+    the same types are rendered many times.
+    """
+    # Every TypedDict gets its own function, which only renders it if it has no
+    # assignment. The source then stays flat however deeply the types are nested.
+    namespace: dict[str, Any] = {}
+    functions: dict[TypedDictCode, str] = {}
+    pending: list[TypedDictCode] = []
+    sources = [
+        f"def render(assignments):\n    return {_join_parts([code], functions, pending)}\n"
+    ]
+    while pending:
+        typed_dict = pending.pop()
+        function = functions[typed_dict]
+        namespace[f"{function}_code"] = typed_dict
+        sources.append(
+            f"def {function}(assignments):\n"
+            f"    assignment = assignments.get({function}_code)\n"
+            "    if assignment is not None:\n"
+            "        return assignment\n"
+            f"    return {_render_dict_expr(typed_dict, functions, pending)}\n"
+        )
+    exec("\n".join(sources), namespace)
+    return namespace["render"]
+
+
+def _render_dict_expr(
+    typed_dict: TypedDictCode,
+    functions: dict[TypedDictCode, str],
+    pending: list[TypedDictCode],
+) -> str:
+    """Build the expression rendering the contents of `typed_dict` in full"""
+    items: list[Any] = [f'TypedDict("{typed_dict.name}", {{ ']
+    for i, (key, value) in enumerate(typed_dict.dict_):
+        items += [", " if i else "", f'"{key}": ', value]
+    items.append(" })")
+    return _join_parts(items, functions, pending)
+
+
+def _join_parts(
+    items: list[Any], functions: dict[TypedDictCode, str], pending: list[TypedDictCode]
+) -> str:
+    """
+    Build an expression that joins `items`, which are literal strings and types.
+    Lists and unions are expanded in place and adjacent literals are merged, so
+    the expression is never nested.
+    """
+    parts: list[str] = []
+    literal: list[str] = []
+    # Explicit stack instead of recursion, in reverse so that items are popped
+    # in their original order
+    stack = items[::-1]
+    while stack:
+        item = stack.pop()
+        if type(item) is str:
+            literal.append(item)
+        elif item._str is not None:
+            literal.append(item._str)
+        elif type(item) is TypedDictCode:
+            function = functions.get(item)
+            if function is None:
+                function = functions[item] = f"render{len(functions)}"
+                pending.append(item)
+            if literal:
+                parts.append(repr("".join(literal)))
+                literal = []
+            parts.append(f"{function}(assignments)")
+        elif type(item) is ListCode:
+            stack += ["]", item.inner_type, "List["]
+        elif type(item) is UnionCode:
+            if len(item.inner_types) == 1:
+                stack.append(item.inner_types[0])
+            else:
+                members = list(itertools.chain(*((t, ", ") for t in item.inner_types)))
+                stack.append("]")
+                stack += members[-2::-1]
+                stack.append("Union[")
+        else:
+            raise Exception(f"Unsupported type: {item}")
+    if literal:
+        parts.append(repr("".join(literal)))
+    if len(parts) == 1:
+        return parts[0]
+    return f"''.join([{', '.join(parts)}])"
 
 
 def find_all_typed_dicts(
     name: str, dict_: dict[str, Any]
-) -> Iterator[Tuple[KeyPath, TypedDictCode]]:
-    toplevel_dict, type_assignments = get_types(name, dict_)
+) -> Iterator[tuple[KeyPath, TypedDictCode]]:
+    toplevel_dict = get_types(name, dict_)[-1]
     assert isinstance(toplevel_dict, TypedDictCode)
-    yield from _find_all_typed_dicts(KeyPath(name), toplevel_dict)
+    yield from find_all_typed_dicts_in_code(toplevel_dict)
 
 
-def _find_all_typed_dicts(
-    path: KeyPath, code: Code
-) -> Iterator[Tuple[KeyPath, TypedDictCode]]:
-    """Recursive helper fn for a depth-first search through the typed dictionary"""
-    if isinstance(code, BuiltInCode):
-        return
+def find_all_typed_dicts_in_code(
+    toplevel_dict: TypedDictCode,
+) -> Iterator[tuple[KeyPath, TypedDictCode]]:
+    """
+    Depth-first search through an already inferred typed dictionary.
+    Paths start with the name of `toplevel_dict`.
+    """
+    for path, code in _walk_typed_dicts(toplevel_dict):
+        yield KeyPath(".".join(path)), code
 
-    if isinstance(code, TypedDictCode):
-        yield path, code
-        for key, val in code.dict_:
-            yield from _find_all_typed_dicts(KeyPath(f"{path}.{key}"), val)
-        return
 
-    if isinstance(code, ListCode):
-        yield from _find_all_typed_dicts(path, code.inner_type)
-    elif isinstance(code, UnionCode):
-        for type_ in code.inner_types:
-            yield from _find_all_typed_dicts(path, type_)
-    else:
-        raise Exception(f"Unsupported type: {code}")
+def _walk_typed_dicts(
+    toplevel_dict: TypedDictCode,
+) -> Iterator[tuple[tuple[str, ...], TypedDictCode]]:
+    """
+    The search behind `find_all_typed_dicts_in_code` and
+    `accumulate_typed_dicts_in_code`, which yields the paths as tuples of keys.
+    """
+    # Explicit stack instead of recursion, so deep nesting neither hits the
+    # recursion limit nor passes every yield up through a chain of generators.
+    # Children are pushed in reverse to visit them in their original order.
+    # Paths are kept as tuples of keys and only joined by the callers,
+    # instead of building a string for every value along the way.
+    stack: list[tuple[tuple[str, ...], Code]] = [((toplevel_dict.name,), toplevel_dict)]
+    while stack:
+        path, code = stack.pop()
+        if type(code) is BuiltInCode:
+            continue
+
+        if type(code) is TypedDictCode:
+            yield path, code
+            for key, val in reversed(code.dict_):
+                # built-in types can't contain TypedDicts
+                if type(val) is not BuiltInCode:
+                    stack.append((path + (key,), val))
+        elif type(code) is ListCode:
+            stack.append((path, code.inner_type))
+        elif type(code) is UnionCode:
+            stack.extend((path, type_) for type_ in reversed(code.inner_types))
+        else:
+            raise Exception(f"Unsupported type: {code}")
 
 
 def accumulate_typed_dicts(
     name: str, dict_: dict
 ) -> dict[KeyPath, list[TypedDictCode]]:
-    accumulated_dicts: dict = {}
-    for path, typed_dict in find_all_typed_dicts(KeyPath(name), dict_):
-        accumulated_dicts.setdefault(path, []).append(typed_dict)
-    return accumulated_dicts
+    toplevel_dict = get_types(name, dict_)[-1]
+    assert isinstance(toplevel_dict, TypedDictCode)
+    return accumulate_typed_dicts_in_code(toplevel_dict)
+
+
+def accumulate_typed_dicts_in_code(
+    toplevel_dict: TypedDictCode,
+) -> dict[KeyPath, list[TypedDictCode]]:
+    """
+    Same search as `find_all_typed_dicts_in_code`, but groups the TypedDicts by
+    path as it goes instead of yielding them one at a time.
+    Each distinct TypedDict is listed once per path.
+    """
+    # Grouped by the tuple of keys, so each path is only joined once at the end.
+    # The dicts are used as ordered sets that drop duplicates on insertion.
+    accumulated_dicts: dict[tuple[str, ...], dict[TypedDictCode, None]] = {}
+    for path, code in _walk_typed_dicts(toplevel_dict):
+        accumulated_dicts.setdefault(path, {})[code] = None
+    return {
+        KeyPath(".".join(path)): list(typed_dicts)
+        for path, typed_dicts in accumulated_dicts.items()
+    }
 
 
 # ============================================================================
@@ -260,23 +788,72 @@ import click
 import json
 import os
 
+try:
+    # orjson parses a lot faster than the json module, so use it if it's installed
+    import orjson as json_backend  # type: ignore
+except ImportError:
+    json_backend = json  # type: ignore
+
+try:
+    import ijson  # type: ignore
+except ImportError:
+    ijson = None
+
+# With ijson installed, the input is parsed incrementally, so it never has to
+# fit into memory all at once. Only its C backends are fast enough for that,
+# the pure Python one is several times slower than loading the whole document.
+CAN_STREAM = ijson is not None and ijson.backend in ("yajl2_c", "yajl2_cffi")
+
+
+# orjson turns integers that don't fit into 64 bits into floats, without an
+# error. Only numbers with at least 19 digits can be that big, so documents that
+# contain any run of 19 digits are parsed with the json module instead. That
+# includes digits in strings, e.g. nanosecond timestamps or long numeric ids,
+# which then don't get the faster parser.
+LONG_NUMBER = re.compile(rb"[0-9]{19}")
+
+
+def load_json(data: bytes) -> JsonValue:
+    if json_backend is not json and LONG_NUMBER.search(data) is None:
+        try:
+            return json_backend.loads(data)
+        except json_backend.JSONDecodeError:
+            # orjson rejects NaN, Infinity, floats out of range and lone
+            # surrogates, all of which the json module accepts
+            pass
+    return json.loads(data)
+
+
+def read_types(name: str, file: IO[bytes]) -> list[Code]:
+    if CAN_STREAM:
+        try:
+            return get_types_from_stream(name, file)
+        except ijson.JSONError:
+            # ijson rejects NaN and Infinity, which the json module accepts.
+            # Files can be read again from the start and loaded instead.
+            if not file.seekable():
+                raise
+            file.seek(0)
+    return get_types(name, load_json(file.read()))
+
 
 @click.command()
 @click.argument(
     "file", type=click.Path(exists=True, dir_okay=False, readable=True, allow_dash=True)
 )
 def cli(file: str):
+    filename = os.path.basename(file)
+    filename, _ = os.path.splitext(filename)
+
     try:
-        with click.open_file(file) as f:
-            data = json.load(f)
+        with click.open_file(file, "rb") as f:
+            types = read_types(filename.title(), f)
     except Exception as e:
         click.echo(f"Input must be a valid json file. Error: {e}")
         return
-    filename = os.path.basename(file)
-    filename, _ = os.path.splitext(filename)
 
-    if isinstance(data, dict):
-        code = generate_typed_dict_code(filename.title(), data)
+    if isinstance(types[-1], TypedDictCode):
+        code = generate_code_for_types(types)
         click.echo(code, nl=False)
     else:
         click.echo("Json does not represent a dictionary")